@@ -6,75 +6,100 @@ Generates SQL INSERT statements from filtered CSV/JSON files
 """
 
 import pandas as pd
+import argparse
 import os
-import glob
 import json
-from typing import List
+import re
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+import pyarrow as pa
+import pyarrow.csv as pv
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
 
-def clean_value(value):
-    """Clean and format value for SQL insertion"""
-    if pd.isna(value) or value == '':
-        return 'NULL'
+CSV_DIR = "outputs/csv"
 
-    # Convert to string and handle special characters
-    value_str = str(value).strip()
+# Matches general output files such as THE_2026_rankings.csv, capturing the year and table
+CSV_NAME_RE = re.compile(r'^THE_(\d{4})_(rankings|key_statistics)\.csv$')
 
-    # Handle percentages (remove % sign)
-    if value_str.endswith('%'):
-        value_str = value_str[:-1]
+RANKINGS_COLUMNS = [
+    'Rank', 'rank_prefix', 'Name', 'Overall', 'Teaching', 'Research Environment',
+    'Research Quality', 'Industry', 'International Outlook'
+]
 
-    # Handle ratios (replace : with /)
-    if ' : ' in value_str:
-        value_str = value_str.replace(' : ', '/')
+KEY_STATISTICS_COLUMNS = [
+    'Rank', 'rank_prefix', 'Name', 'No. of FTE students', 'No. of students per staff',
+    'International students', 'Female:Male ratio'
+]
 
-    # Escape single quotes for SQL
-    value_str = value_str.replace("'", "''")
+RANKINGS_INSERT_SQL = "INSERT INTO Rankings (year, rank, rank_prefix, name, overall, teaching, research_environment, research_quality, industry, international_outlook)"
+
+KEY_STATISTICS_INSERT_SQL = "INSERT INTO Key_Statistics (year, rank, rank_prefix, name, fte_students, students_per_staff, international_students, female_male_ratio)"
+
+# Rows per multi-row INSERT statement
+BATCH_SIZE = 500
+
+# Upper bound on worker processes for SQL generation (the input is only ~32 small files)
+MAX_PROCESSES = 4
+
+def normalize_series(series: pd.Series) -> pd.Series:
+    """Normalize a whole column for the database, leaving empty values missing"""
+    text = series.astype(str)
+    is_null = series.isna() | (text == '')
+
+    # Handle percentages (remove % sign) and ratios (replace : with /)
+    text = text.str.strip().str.removesuffix('%').str.replace(' : ', '/', regex=False)
 
-    return f"'{value_str}'"
+    return text.mask(is_null)
+
+def clean_series(series: pd.Series) -> pd.Series:
+    """Clean and format a whole column for SQL insertion"""
+    text = normalize_series(series)
+
+    # Escape single quotes for SQL
+    text = text.str.replace("'", "''", regex=False)
+
+    return ("'" + text + "'").fillna('NULL')
+
+def build_values(df: pd.DataFrame, year: int, columns: List[str]) -> pd.Series:
+    """Build the SQL VALUES tuple body for every row of df"""
+    cleaned = [
+        clean_series(df[col]) if col in df.columns else pd.Series('NULL', index=df.index)
+        for col in columns
+    ]
+    return pd.Series(str(year), index=df.index).str.cat(cleaned, sep=', ')
+
+def batch_inserts(insert_sql: str, values: pd.Series, batch_size: int = BATCH_SIZE) -> List[str]:
+    """Group VALUES tuples into multi-row INSERT statements of batch_size rows"""
+    rows = ('(' + values + ')').tolist()
+    return [
+        insert_sql + " VALUES\n" + ",\n".join(rows[i:i + batch_size]) + ";"
+        for i in range(0, len(rows), batch_size)
+    ]
 
 def generate_rankings_insert(df: pd.DataFrame, year: int) -> List[str]:
-    """Generate INSERT statements for Rankings table"""
-    inserts = []
-
-    for _, row in df.iterrows():
-        values = [
-            str(year),  # year
-            clean_value(row.get('Rank', '')),
-            clean_value(row.get('rank_prefix', '')),  # rank_prefix
-            clean_value(row.get('Name', '')),
-            clean_value(row.get('Overall', '')),
-            clean_value(row.get('Teaching', '')),
-            clean_value(row.get('Research Environment', '')),
-            clean_value(row.get('Research Quality', '')),
-            clean_value(row.get('Industry', '')),
-            clean_value(row.get('International Outlook', ''))
-        ]
-
-        sql = f"INSERT INTO Rankings (year, rank, rank_prefix, name, overall, teaching, research_environment, research_quality, industry, international_outlook) VALUES ({', '.join(values)});"
-        inserts.append(sql)
-
-    return inserts
+    """Generate batched INSERT statements for Rankings table"""
+    values = build_values(df, year, RANKINGS_COLUMNS)
+    return batch_inserts(RANKINGS_INSERT_SQL, values)
 
 def generate_key_statistics_insert(df: pd.DataFrame, year: int) -> List[str]:
-    """Generate INSERT statements for Key_Statistics table"""
-    inserts = []
-
-    for _, row in df.iterrows():
-        values = [
-            str(year),  # year
-            clean_value(row.get('Rank', '')),
-            clean_value(row.get('rank_prefix', '')),  # rank_prefix
-            clean_value(row.get('Name', '')),
-            clean_value(row.get('No. of FTE students', '')),
-            clean_value(row.get('No. of students per staff', '')),
-            clean_value(row.get('International students', '')),
-            clean_value(row.get('Female:Male ratio', ''))
-        ]
-
-        sql = f"INSERT INTO Key_Statistics (year, rank, rank_prefix, name, fte_students, students_per_staff, international_students, female_male_ratio) VALUES ({', '.join(values)});"
-        inserts.append(sql)
-
-    return inserts
+    """Generate batched INSERT statements for Key_Statistics table"""
+    values = build_values(df, year, KEY_STATISTICS_COLUMNS)
+    return batch_inserts(KEY_STATISTICS_INSERT_SQL, values)
+
+def build_rows(df: pd.DataFrame, year: int, columns: List[str]) -> List[tuple]:
+    """Build parameter tuples for sqlite3.executemany, with None for NULL"""
+    cleaned = []
+    for col in columns:
+        if col not in df.columns:
+            cleaned.append([None] * len(df))
+            continue
+        text = normalize_series(df[col])
+        cleaned.append(text.astype(object).where(text.notna(), None).tolist())
+
+    return list(zip([year] * len(df), *cleaned))
 
 def create_table_sql():
     """Generate table creation SQL"""
@@ -117,75 +142,157 @@ CREATE INDEX IF NOT EXISTS idx_key_stats_name ON Key_Statistics(name);
 """
     return tables_sql
 
-def process_csv_files():
-    """Process all CSV files and generate SQL"""
-    rankings_files = glob.glob("outputs/csv/THE_*_rankings.csv")
-    key_stats_files = glob.glob("outputs/csv/THE_*_key_statistics.csv")
-
-    all_sql = []
-
-    # Add table creation SQL
-    all_sql.append("-- Table Creation SQL")
-    all_sql.append(create_table_sql())
-    all_sql.append("\n-- Data Insert SQL\n")
-
-    # Process Rankings files
-    print("Processing Rankings files...")
-    for csv_file in sorted(rankings_files):
+def read_table_csv(csv_file: str, columns: List[str], use_threads: bool = True) -> pd.DataFrame:
+    """Read only the given columns of a CSV file with the Arrow parser (multi-threaded by default)"""
+    options = pv.ConvertOptions(
+        include_columns=columns,
+        include_missing_columns=True,
+        strings_can_be_null=True,  # treat 'n/a' and friends as missing, like pd.read_csv
+    )
+    read_options = pv.ReadOptions(use_threads=use_threads)
+    return pv.read_csv(csv_file, read_options=read_options, convert_options=options).to_pandas()
+
+def find_csv_files(table: str) -> List[Tuple[str, int]]:
+    """Return sorted (path, year) pairs for every general CSV file of the given table"""
+    matches = []
+    with os.scandir(CSV_DIR) as entries:
+        for entry in entries:
+            match = CSV_NAME_RE.match(entry.name)
+            if match and match.group(2) == table:
+                matches.append((entry.path, int(match.group(1))))
+
+    return sorted(matches)
+
+def iter_csv_files(table: str, columns: List[str]) -> Iterator[Tuple[str, int, pd.DataFrame]]:
+    """Yield (path, year, DataFrame) for every general CSV file of the given table"""
+    for csv_file, year in find_csv_files(table):
         print(f"Reading: {csv_file}")
         try:
-            df = pd.read_csv(csv_file)
-            year = int(csv_file.split('_')[1])  # Extract year from filename
-
-            inserts = generate_rankings_insert(df, year)
-            all_sql.extend(inserts)
-            print(f"Generated {len(inserts)} INSERT statements for Rankings {year}")
-
-        except Exception as e:
-            print(f"Error processing {csv_file}: {e}")
-
-    # Process Key Statistics files
-    print("\nProcessing Key Statistics files...")
-    for csv_file in sorted(key_stats_files):
-        print(f"Reading: {csv_file}")
-        try:
-            df = pd.read_csv(csv_file)
-            year = int(csv_file.split('_')[1])  # Extract year from filename
-
-            inserts = generate_key_statistics_insert(df, year)
-            all_sql.extend(inserts)
-            print(f"Generated {len(inserts)} INSERT statements for Key Statistics {year}")
-
-        except Exception as e:
+            df = read_table_csv(csv_file, columns)
+        except (OSError, ValueError, pa.ArrowException) as e:
             print(f"Error processing {csv_file}: {e}")
-
-    return all_sql
-
-def save_sql_file(sql_statements: List[str], filename: str = "outputs/the_rankings_insert.sql"):
-    """Save SQL statements to file"""
+            continue
+
+        yield csv_file, year, df
+
+def _process_one(csv_file: str, year: int, table: str) -> Tuple[List[str], int]:
+    """Read one CSV file and return its INSERT statements and row count (runs in a worker process)"""
+    # One parser thread per file: parallelism comes from the worker processes
+    if table == "rankings":
+        df = read_table_csv(csv_file, RANKINGS_COLUMNS, use_threads=False)
+        return generate_rankings_insert(df, year), len(df)
+
+    df = read_table_csv(csv_file, KEY_STATISTICS_COLUMNS, use_threads=False)
+    return generate_key_statistics_insert(df, year), len(df)
+
+def _submit_file(executor: Optional[ProcessPoolExecutor], csv_file: str, year: int,
+                 table: str) -> Callable[[], Tuple[List[str], int]]:
+    """Schedule one file and return a callable yielding its result; without a pool it runs on demand"""
+    if executor is None:
+        return partial(_process_one, csv_file, year, table)
+    return executor.submit(_process_one, csv_file, year, table).result
+
+def process_csv_files() -> Iterator[str]:
+    """Process all CSV files (in parallel when several CPUs are available) and yield SQL statements as they are ready"""
+    # Table creation SQL
+    yield "-- Table Creation SQL"
+    yield create_table_sql()
+    yield "\n-- Data Insert SQL\n"
+    yield "BEGIN TRANSACTION;"
+
+    # A pool only pays for its start-up and pickling when there is more than one CPU
+    workers = min(MAX_PROCESSES, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    with pool as executor:
+        # Submit both tables up front so workers stay busy; results are collected in file order
+        jobs = {
+            table: deque(
+                (csv_file, year, _submit_file(executor, csv_file, year, table))
+                for csv_file, year in find_csv_files(table)
+            )
+            for table in ("rankings", "key_statistics")
+        }
+
+        for table, label in (("rankings", "Rankings"), ("key_statistics", "Key Statistics")):
+            print(f"\nProcessing {label} files...")
+            while jobs[table]:
+                # Pop each job so its statements can be freed once written
+                csv_file, year, result = jobs[table].popleft()
+                try:
+                    inserts, row_count = result()
+                except (OSError, ValueError, pa.ArrowException) as e:
+                    print(f"Error processing {csv_file}: {e}")
+                    continue
+
+                yield from inserts
+                print(f"Generated {len(inserts)} INSERT statements ({row_count} rows) for {label} {year}")
+
+    yield "COMMIT;"
+
+def load_sqlite(db_path: str):
+    """Load all CSV files straight into a SQLite database using parameter binding"""
+    rankings_sql = f"{RANKINGS_INSERT_SQL} VALUES ({', '.join('?' * (len(RANKINGS_COLUMNS) + 1))})"
+    key_stats_sql = f"{KEY_STATISTICS_INSERT_SQL} VALUES ({', '.join('?' * (len(KEY_STATISTICS_COLUMNS) + 1))})"
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(create_table_sql())
+
+        with conn:
+            print("Loading Rankings files...")
+            for csv_file, year, df in iter_csv_files("rankings", RANKINGS_COLUMNS):
+                conn.executemany(rankings_sql, build_rows(df, year, RANKINGS_COLUMNS))
+                print(f"Loaded {len(df)} rows for Rankings {year}")
+
+            print("\nLoading Key Statistics files...")
+            for csv_file, year, df in iter_csv_files("key_statistics", KEY_STATISTICS_COLUMNS):
+                conn.executemany(key_stats_sql, build_rows(df, year, KEY_STATISTICS_COLUMNS))
+                print(f"Loaded {len(df)} rows for Key Statistics {year}")
+    finally:
+        conn.close()
+
+    print(f"\n✅ Database loaded: {db_path}")
+
+def save_sql_file(sql_statements: Iterable[str], filename: str = "outputs/the_rankings_insert.sql"):
+    """Stream SQL statements to file as they are generated"""
     # Ensure outputs directory exists
     os.makedirs("outputs", exist_ok=True)
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(sql_statements))
+    statement_count = 0
+    with open(filename, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        for statement in sql_statements:
+            f.write(statement)
+            f.write('\n')
+            statement_count += 1
 
     print(f"\n✅ SQL file saved: {filename}")
-    print(f"Total SQL statements: {len(sql_statements)}")
+    print(f"Total SQL statements: {statement_count}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate SQL from THE rankings CSV files")
+    parser.add_argument(
+        "--direct-load",
+        metavar="DB_PATH",
+        help="load the data straight into this SQLite database instead of writing a SQL file",
+    )
+    args = parser.parse_args()
+
     print("THE Rankings Database Insert Generator")
     print("=" * 50)
 
-    if not os.path.exists("outputs/csv"):
-        print("❌ outputs/csv directory not found!")
+    if not os.path.exists(CSV_DIR):
+        print(f"❌ {CSV_DIR} directory not found!")
         print("Please run the_university_rankings_full.py first to generate data.")
         return
 
-    # Generate SQL
-    sql_statements = process_csv_files()
+    if args.direct_load:
+        load_sqlite(args.direct_load)
+        return
 
-    # Save to file
-    save_sql_file(sql_statements)
+    # Generate SQL and stream it to file
+    save_sql_file(process_csv_files())
 
     print("\n📋 SQL File contains:")
     print("  - Table creation statements")
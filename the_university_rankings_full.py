@@ -6,11 +6,18 @@ Fetches both 'Rankings' and 'Key statistics' tables from official THE JSON endpo
 Saves filtered results in both CSV and JSON formats for database insertion.
 """
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import argparse
+import csv
+import hashlib
 import os
+import tempfile
+import threading
 import time
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Iterable, Optional
 
 BASE_URL = "https://www.timeshighereducation.com/json/ranking_tables/world_university_rankings"
@@ -23,6 +30,37 @@ HEADERS = {
     "Accept": "application/json, text/plain, */*",
 }
 
+# Shared session so every request to THE reuses a warm keep-alive connection
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
+
+# Transient failures are retried by fetch_json itself (not urllib3) so that every
+# attempt, retries included, goes through the request rate limit below
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled for each further one
+
+# Concurrent fetching: worker threads share SESSION, while request starts are spaced
+# globally. The default keeps the old one-request-per-second pace; workers only hide latency.
+MAX_WORKERS = 4
+DEFAULT_REQUEST_INTERVAL = 1.0  # seconds between request starts
+_request_interval = DEFAULT_REQUEST_INTERVAL
+_rate_lock = threading.Lock()
+_next_request_at = 0.0
+_print_lock = threading.Lock()
+
+# On-disk cache of raw API responses, keyed by a hash of the URL
+CACHE_DIR = os.path.join(".cache", "the_json")
+DEFAULT_CACHE_TTL_DAYS = 7
+_cache_ttl_seconds = DEFAULT_CACHE_TTL_DAYS * 86400
+_refresh_cache = False
+
+# Output directories already created this run (saves a makedirs syscall per write)
+_MKDIR_CACHE: set[str] = set()
+
 # Database field mappings
 RANKINGS_FIELDS = {
     'rank': 'Rank',
@@ -44,6 +82,24 @@ KEY_STATISTICS_FIELDS = {
     'stats_female_male_ratio': 'Female:Male ratio'
 }
 
+
+def build_field_recipe(field_mapping: dict) -> tuple:
+    """Compile a field mapping into (json_field, db_field, needs_numeric_clean, is_rank) tuples."""
+    return tuple(
+        (
+            json_field,
+            db_field,
+            json_field.startswith('scores_') or json_field == 'stats_student_staff_ratio',
+            json_field == 'rank',
+        )
+        for json_field, db_field in field_mapping.items()
+    )
+
+
+# Precompiled once so filtering never re-derives the per-field handling
+RANKINGS_RECIPE = build_field_recipe(RANKINGS_FIELDS)
+KEY_STATISTICS_RECIPE = build_field_recipe(KEY_STATISTICS_FIELDS)
+
 SUBJECT_SLUGS = [
     "arts-and-humanities",
     "business-and-economics",
@@ -73,15 +129,113 @@ SUBJECT_DISPLAY_NAMES = {
 }
 
 
+def log(message: str) -> None:
+    """Print one line without interleaving output from worker threads."""
+    with _print_lock:
+        print(message)
+
+
+def _wait_for_request_slot() -> None:
+    """Block until this thread may start a request (global rate limit)."""
+    global _next_request_at
+    with _rate_lock:
+        now = time.monotonic()
+        start_at = max(now, _next_request_at)
+        _next_request_at = start_at + _request_interval
+    if start_at > now:
+        time.sleep(start_at - now)
+
+
+def configure_rate_limit(interval: float = DEFAULT_REQUEST_INTERVAL) -> None:
+    """Set the minimum number of seconds between the starts of any two API requests."""
+    global _request_interval
+    _request_interval = interval
+
+
+def _ensure_dir(path: str) -> None:
+    """Create a directory once per run; concurrent first calls are harmless with exist_ok."""
+    if path not in _MKDIR_CACHE:
+        os.makedirs(path, exist_ok=True)
+        _MKDIR_CACHE.add(path)
+
+
+def configure_cache(ttl_days: float = DEFAULT_CACHE_TTL_DAYS, refresh: bool = False) -> None:
+    """Set how long cached responses stay fresh, or force every URL to be re-downloaded."""
+    global _cache_ttl_seconds, _refresh_cache
+    _cache_ttl_seconds = ttl_days * 86400
+    _refresh_cache = refresh
+
+
+def _cache_path(url: str) -> str:
+    """Return the cache file used for a URL."""
+    return os.path.join(CACHE_DIR, f"{hashlib.sha1(url.encode()).hexdigest()}.json")
+
+
+def _read_cache(url: str):
+    """Return the cached JSON for a URL if it is fresh, else None."""
+    if _refresh_cache:
+        return None
+    path = _cache_path(url)
+    try:
+        if time.time() - os.path.getmtime(path) > _cache_ttl_seconds:
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def _write_cache(url: str, content: bytes) -> None:
+    """Store a raw response body; written to a temp file first so readers never see partial data."""
+    tmp_path = None
+    try:
+        _ensure_dir(CACHE_DIR)
+        # Unique per call, so concurrent threads and concurrent runs never share a temp file
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            f.write(content)
+        os.replace(tmp_path, _cache_path(url))
+    except OSError as e:
+        log(f"[WARN] Could not cache {url}: {e}")
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def _get_with_retries(url: str) -> requests.Response:
+    """GET a URL, retrying connection errors, timeouts and RETRY_STATUSES with backoff."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        if attempt > 1:
+            time.sleep(RETRY_BACKOFF * 2 ** (attempt - 2))
+        _wait_for_request_slot()
+        try:
+            r = SESSION.get(url, timeout=60)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_ATTEMPTS:
+                raise
+            continue
+        if r.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS:
+            return r
+        r.close()
+
+
 def fetch_json(url):
-    """Safely fetch JSON and return dict or None."""
+    """Safely fetch JSON (from the on-disk cache when fresh) and return dict or None."""
+    cached = _read_cache(url)
+    if cached is not None:
+        return cached
+
     try:
-        r = requests.get(url, headers=HEADERS, timeout=60)
+        r = _get_with_retries(url)
         if r.status_code == 200:
-            return r.json()
-        print(f"[WARN] {r.status_code} for {url}")
-    except Exception as e:
-        print(f"[ERROR] Fetch failed for {url}: {e}")
+            data = orjson.loads(r.content)
+            _write_cache(url, r.content)
+            return data
+        log(f"[WARN] {r.status_code} for {url}")
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
+        log(f"[ERROR] Fetch failed for {url}: {e}")
     return None
 
 
@@ -90,80 +244,112 @@ def get_subject_display_name(subject_slug: str) -> str:
     return SUBJECT_DISPLAY_NAMES.get(subject_slug, subject_slug.replace('-', ' ').title())
 
 
-def filter_data_for_db(data, year, field_mapping):
-    """Filter JSON data to only include fields needed for database insertion."""
+def filter_data_for_db(data, year, recipe) -> Optional[pd.DataFrame]:
+    """Filter JSON data to only the fields needed for database insertion, as a DataFrame.
+
+    ``recipe`` is a precompiled field recipe (see build_field_recipe); a plain
+    field mapping dict is compiled on the fly.
+    """
     if not data or "data" not in data:
         return None
+    if isinstance(recipe, dict):
+        recipe = build_field_recipe(recipe)
 
-    filtered_data = []
+    universities = data["data"]
+    row_count = len(universities)
 
-    for university in data["data"]:
-        filtered_university = {'year': year}  # Add year field
+    # Build each output column as one list; columns are year, mapped fields, rank_prefix
+    columns = {'year': [year] * row_count}
+    rank_prefix = [None] * row_count
 
-        # Map and filter fields
-        for json_field, db_field in field_mapping.items():
-            value = university.get(json_field, '')
+    for json_field, db_field, needs_numeric_clean, is_rank in recipe:
+        values = [university.get(json_field, '') for university in universities]
 
-            # Special handling for rank field
-            if json_field == 'rank' and isinstance(value, str) and value.startswith('='):
-                # Separate rank prefix and numeric value
-                filtered_university['rank_prefix'] = '='
-                filtered_university[db_field] = value[1:]  # Remove '=' prefix
-            else:
-                # Clean up numeric values
-                if json_field.startswith('scores_') or json_field == 'stats_student_staff_ratio':
-                    # Remove commas and handle empty values
-                    value = str(value).replace(',', '') if value else ''
-                filtered_university[db_field] = value
+        # Special handling for rank field
+        if is_rank:
+            for i, value in enumerate(values):
+                if isinstance(value, str) and value.startswith('='):
+                    # Separate rank prefix and numeric value
+                    rank_prefix[i] = '='
+                    values[i] = value[1:]  # Remove '=' prefix
+        # Clean up numeric values
+        elif needs_numeric_clean:
+            # Remove commas and handle empty values
+            values = [str(value).replace(',', '') if value else '' for value in values]
 
-        filtered_data.append(filtered_university)
+        columns[db_field] = values
 
-    return {"data": filtered_data}
+    columns['rank_prefix'] = rank_prefix
+    # object dtype keeps raw API values (and None) as-is instead of inferring NaN-backed dtypes
+    return pd.DataFrame(columns, dtype=object, copy=False)
 
 
-def save_outputs(year, data, name, category: str = "general"):
+def save_outputs(year, df: Optional[pd.DataFrame], name, category: str = "general"):
     """Save both CSV and JSON versions for a given dataset."""
-    if not data or "data" not in data:
-        print(f"[WARN] No data for {year} {name}.")
+    if df is None:
+        log(f"[WARN] No data for {year} {name}.")
         return
 
     json_dir = os.path.join("outputs", "json", category)
     csv_dir = os.path.join("outputs", "csv", category)
-    os.makedirs(json_dir, exist_ok=True)
-    os.makedirs(csv_dir, exist_ok=True)
+    _ensure_dir(json_dir)
+    _ensure_dir(csv_dir)
 
-    # JSON output
+    # JSON output (records zipped from row tuples; cheaper than DataFrame.to_dict)
     json_path = os.path.join(json_dir, f"THE_{year}_{name}.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-    # CSV output
+    fields = list(df.columns)
+    rows = list(df.itertuples(index=False, name=None))
+    records = [dict(zip(fields, row)) for row in rows]
+    # Written compact (no indent): same {"data": [...]} document, ~30% fewer bytes
+    with open(json_path, "wb") as f:
+        f.write(orjson.dumps({"data": records}, option=orjson.OPT_NON_STR_KEYS))
+
+    # CSV output (same rows written straight through csv.writer; None becomes an empty field)
     csv_path = os.path.join(csv_dir, f"THE_{year}_{name}.csv")
-    df = pd.DataFrame(data["data"])
-    df.to_csv(csv_path, index=False, encoding="utf-8")
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(fields)
+        writer.writerows(rows)
+
+    log(f"[DONE] {year} {name}: {len(df)} rows → {csv_path}")
+
+
+def fetch_and_save(url: str, year: int, recipe: tuple, name: str, category: str) -> None:
+    """Fetch one endpoint, filter it and save the CSV/JSON outputs."""
+    data = fetch_json(url)
+    if data:
+        save_outputs(year, filter_data_for_db(data, year, recipe), name, category=category)
+
+
+def run_tasks(tasks: list[tuple]) -> None:
+    """Run fetch_and_save tasks concurrently on a bounded thread pool.
+
+    The first worker error or a Ctrl-C cancels every task that has not started yet;
+    only requests already in flight are allowed to finish.
+    """
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    futures = [executor.submit(fetch_and_save, *task) for task in tasks]
+    try:
+        for future in as_completed(futures):
+            future.result()  # re-raise anything unexpected from a worker
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+
 
-    print(f"[DONE] {year} {name}: {len(df)} rows → {csv_path}")
+def _year_tasks(year: int) -> list[tuple]:
+    """Tasks for both general tables of a single year."""
+    return [
+        (f"{BASE_URL}/{year}", year, RANKINGS_RECIPE, "rankings", "general"),
+        (f"{BASE_URL}/{year}/key_statistics", year, KEY_STATISTICS_RECIPE, "key_statistics", "general"),
+    ]
 
 
 def process_year(year):
     """Fetch and save both tables for a single year."""
     print(f"\n=== YEAR {year} ===")
-
-    # Rankings
-    rankings_url = f"{BASE_URL}/{year}"
-    rankings_data = fetch_json(rankings_url)
-    if rankings_data:
-        filtered_rankings = filter_data_for_db(rankings_data, year, RANKINGS_FIELDS)
-        save_outputs(year, filtered_rankings, "rankings", category="general")
-    time.sleep(1)
-
-    # Key statistics
-    key_stats_url = f"{BASE_URL}/{year}/key_statistics"
-    key_stats_data = fetch_json(key_stats_url)
-    if key_stats_data:
-        filtered_key_stats = filter_data_for_db(key_stats_data, year, KEY_STATISTICS_FIELDS)
-        save_outputs(year, filtered_key_stats, "key_statistics", category="general")
-    time.sleep(1)
+    run_tasks(_year_tasks(year))
 
 
 def _build_subject_url(year: int, subject_slug: str, suffix: Optional[str] = None) -> str:
@@ -174,30 +360,31 @@ def _build_subject_url(year: int, subject_slug: str, suffix: Optional[str] = Non
     return subject_base
 
 
+def _subject_tasks(year: int, subject_slug: str) -> list[tuple]:
+    """Tasks for both tables of a subject in a given year."""
+    return [
+        (_build_subject_url(year, subject_slug), year, RANKINGS_RECIPE, f"{subject_slug}_rankings", "subject"),
+        (
+            _build_subject_url(year, subject_slug, "key_statistics"),
+            year,
+            KEY_STATISTICS_RECIPE,
+            f"{subject_slug}_key_statistics",
+            "subject",
+        ),
+    ]
+
+
 def process_subject(year: int, subject_slug: str) -> None:
     """Fetch rankings and key statistics for a subject in a given year."""
     print(f"\n=== SUBJECT {year} – {subject_slug} ===")
-
-    rankings_url = _build_subject_url(year, subject_slug)
-    rankings_data = fetch_json(rankings_url)
-    if rankings_data:
-        filtered_rankings = filter_data_for_db(rankings_data, year, RANKINGS_FIELDS)
-        save_outputs(year, filtered_rankings, f"{subject_slug}_rankings", category="subject")
-    time.sleep(1)
-
-    key_stats_url = _build_subject_url(year, subject_slug, "key_statistics")
-    key_stats_data = fetch_json(key_stats_url)
-    if key_stats_data:
-        filtered_key_stats = filter_data_for_db(key_stats_data, year, KEY_STATISTICS_FIELDS)
-        save_outputs(year, filtered_key_stats, f"{subject_slug}_key_statistics", category="subject")
-    time.sleep(1)
+    run_tasks(_subject_tasks(year, subject_slug))
 
 
 def process_subjects_for_year(year: int, subject_slugs: Optional[Iterable[str]] = None) -> None:
     """Batch processor for several subject slugs."""
     slugs = list(subject_slugs or SUBJECT_SLUGS)
-    for slug in slugs:
-        process_subject(year, slug)
+    print(f"\n=== SUBJECTS {year} – {len(slugs)} subject(s) ===")
+    run_tasks([task for slug in slugs for task in _subject_tasks(year, slug)])
 
 
 def ask_years_range() -> list[int]:
@@ -263,19 +450,22 @@ def run_interactive() -> None:
     """Run the scraper based on interactive user input."""
     mode = ask_data_mode()
     years = ask_years_range()
-    performed_general = False
-    performed_subject = False
-
-    if mode in {"general", "both"}:
-        performed_general = True
-        for year in years:
-            process_year(year)
-
-    if mode in {"subject", "both"}:
-        subject_slugs = ask_subject_slugs()
-        performed_subject = True
-        for year in years:
-            process_subjects_for_year(year, subject_slugs)
+    performed_general = mode in {"general", "both"}
+    performed_subject = mode in {"subject", "both"}
+    subject_slugs = ask_subject_slugs() if performed_subject else []
+
+    # Queue every endpoint up front so the pool stays busy across years and subjects
+    tasks = []
+    if performed_general:
+        tasks.extend(task for year in years for task in _year_tasks(year))
+    if performed_subject:
+        tasks.extend(task for year in years for slug in subject_slugs for task in _subject_tasks(year, slug))
+
+    print(
+        f"\nFetching {len(tasks)} endpoint(s) with up to {MAX_WORKERS} parallel requests, "
+        f"at most one every {_request_interval:g}s..."
+    )
+    run_tasks(tasks)
 
     print("\n✅ Processing complete.")
     if performed_general and performed_subject:
@@ -287,6 +477,28 @@ def run_interactive() -> None:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Fetch THE World University Rankings data")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ignore cached API responses and download everything again",
+    )
+    parser.add_argument(
+        "--cache-ttl-days",
+        type=float,
+        default=DEFAULT_CACHE_TTL_DAYS,
+        help=f"reuse cached API responses younger than this many days (default: {DEFAULT_CACHE_TTL_DAYS})",
+    )
+    parser.add_argument(
+        "--request-interval",
+        type=float,
+        default=DEFAULT_REQUEST_INTERVAL,
+        help=f"minimum seconds between API requests (default: {DEFAULT_REQUEST_INTERVAL})",
+    )
+    args = parser.parse_args()
+    configure_cache(ttl_days=args.cache_ttl_days, refresh=args.refresh)
+    configure_rate_limit(args.request_interval)
+
     os.makedirs("outputs", exist_ok=True)
     run_interactive()
 